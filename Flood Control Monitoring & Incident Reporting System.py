@@ -4,8 +4,25 @@ from tkinter import ttk, messagebox, filedialog
 import mysql.connector
 from mysql.connector import errorcode
 import csv
-from datetime import datetime
+import os
+import re
+import sys
+import time
+import json
+import uuid
+import zlib
+import queue
+import random
+import argparse
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, date, timedelta
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 # -----------------------
@@ -19,6 +36,16 @@ DB_CONFIG = {
     "database": "flood_control"       # DB name used by default
 }
 
+# run without the GUI: python "Flood Control Monitoring & Incident Reporting System.py" --batch OUT_DIR
+#                  or: python "Flood Control Monitoring & Incident Reporting System.py" --advise-indexes [--apply]
+HEADLESS = any(arg == flag or arg.startswith(flag + "=") for arg in sys.argv[1:] for flag in ("--batch", "--advise-indexes"))
+
+# last successful result of the main GUI reads, used when the app starts during an outage
+OFFLINE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "offline_cache")
+
+# schema changes after the initial CREATE TABLEs (e.g. indexes from --advise-indexes), applied in name order
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
 # -----------------------
 # HELPER: connect to MySQL (optionally create DB/tables)
 # -----------------------
@@ -32,7 +59,8 @@ def get_connection(create_if_missing=True):
             try:
                 tmp = mysql.connector.connect(host=DB_CONFIG["host"],
                                               user=DB_CONFIG["user"],
-                                              password=DB_CONFIG["password"])
+                                              password=DB_CONFIG["password"],
+                                              port=DB_CONFIG.get("port", 3306))
                 cursor = tmp.cursor()
                 cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_CONFIG['database']} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;")
                 tmp.commit() if hasattr(tmp, "commit") else None
@@ -46,9 +74,74 @@ def get_connection(create_if_missing=True):
         else:
             raise
 
+CONNECTION_ERRNOS = {errorcode.CR_CONNECTION_ERROR, errorcode.CR_CONN_HOST_ERROR, errorcode.CR_UNKNOWN_HOST,
+                     errorcode.CR_SERVER_GONE_ERROR, errorcode.CR_SERVER_LOST}
+
+# the statement itself was fine, it just lost a race with another transaction
+LOCK_ERRNOS = {errorcode.ER_LOCK_WAIT_TIMEOUT, errorcode.ER_LOCK_DEADLOCK}
+
+def is_connection_error(err):
+    """True when the server could not be reached (as opposed to it rejecting a statement)."""
+    return isinstance(err, (mysql.connector.InterfaceError, mysql.connector.OperationalError)) or err.errno in CONNECTION_ERRNOS
+
+def is_retryable(err):
+    """True when the same statement can succeed later; anything else is a problem with the data."""
+    return is_connection_error(err) or err.errno in LOCK_ERRNOS
+
+# ----- Utility: run a SELECT and return rows -----
+def fetch_rows(sql, params=None, cache_key=None):
+    """With cache_key the result is also saved under offline_cache/ and served from there
+    while the database is unreachable."""
+    path = cache_key and os.path.join(OFFLINE_CACHE_DIR, cache_key + ".json")
+    try:
+        conn = get_connection()
+    except mysql.connector.Error as err:
+        if path and is_connection_error(err) and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return [tuple(r) for r in json.load(f)]
+        raise
+    cur = conn.cursor()
+    cur.execute(sql, params or ())
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    if path:
+        os.makedirs(OFFLINE_CACHE_DIR, exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(rows, f, default=str)
+        os.replace(path + ".tmp", path)
+    return rows
+
 # -----------------------
 # SCHEMA CREATION & SEED (idempotent)
 # -----------------------
+def apply_migrations(conn):
+    """Run migrations/NNNN_*.sql files not yet recorded in schema_migrations."""
+    cur = conn.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+      name VARCHAR(255) PRIMARY KEY,
+      applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB;
+    """)
+    cur.execute("SELECT name FROM schema_migrations")
+    done = {r[0] for r in cur.fetchall()}
+    names = sorted(os.listdir(MIGRATIONS_DIR)) if os.path.isdir(MIGRATIONS_DIR) else []
+    for name in names:
+        if not name.endswith(".sql") or name in done:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, name), encoding="utf-8") as f:
+            statements = [s.strip() for s in f.read().split(";") if s.strip()]
+        for statement in statements:
+            try:
+                cur.execute(statement)
+            except mysql.connector.Error as err:
+                if err.errno != errorcode.ER_DUP_KEYNAME:  # index already created by hand
+                    raise
+        cur.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+        conn.commit()
+    cur.close()
+
 def ensure_schema_and_seed():
     conn = get_connection(create_if_missing=True)
     cur = conn.cursor()
@@ -93,6 +186,13 @@ def ensure_schema_and_seed():
       INDEX idx_incidents_date (date)
     ) ENGINE=InnoDB;
     """)
+    # idempotency keys of replayed journal writes (see WriteJournal)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS applied_writes (
+      idem_key CHAR(32) PRIMARY KEY,
+      applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB;
+    """)
     conn.commit()
 
     # seed minimal sample data only if areas is empty
@@ -138,14 +238,1053 @@ def ensure_schema_and_seed():
         conn.commit()
 
     cur.close()
+    apply_migrations(conn)
     conn.close()
 
 # Ensure DB and seed data exist
+SCHEMA_READY = False
 try:
     ensure_schema_and_seed()
+    SCHEMA_READY = True
 except Exception as e:
-    messagebox.showerror("DB Error", f"Error creating DB/schema: {e}")
-    raise
+    if not HEADLESS and isinstance(e, mysql.connector.Error) and is_connection_error(e):
+        # start offline on the last-known data; the journal replayer finishes this once the link is back
+        print(f"Database unreachable, starting offline: {e}", file=sys.stderr)
+    else:
+        if not HEADLESS:
+            messagebox.showerror("DB Error", f"Error creating DB/schema: {e}")
+        raise
+
+# -----------------------
+# SHARED INCIDENT STORE (one compact in-memory copy read by every tab and report)
+# -----------------------
+EPOCH = date(1970, 1, 1)
+UNKNOWN_AREA = ("Unknown", "Unknown", "Medium", "No Project")
+
+class IncidentRow:
+    """Read-only view of one incident in an IncidentStore."""
+
+    __slots__ = ("store", "idx")
+
+    def __init__(self, store, idx):
+        self.store = store
+        self.idx = idx
+
+    @property
+    def id(self): return int(self.store.ids[self.idx])
+    @property
+    def area_id(self): return int(self.store.area_ids[self.idx])
+    @property
+    def area_name(self): return self.store.area_info(self.area_id)[0]
+    @property
+    def day(self): return int(self.store.days[self.idx])  # days since EPOCH
+    @property
+    def date(self): return EPOCH + timedelta(days=self.day)
+    @property
+    def flood_level(self): return round(float(self.store.levels[self.idx]), 2)  # DECIMAL(5,2) in the DB
+    @property
+    def damage_cents(self): return int(self.store.damage_cents[self.idx])
+    @property
+    def casualties(self): return int(self.store.casualties[self.idx])
+    @property
+    def notes(self): return self.store.notes[self.idx]
+
+    def values(self):
+        """Treeview values, formatted the way MySQL's DECIMAL columns print."""
+        return (self.id, self.area_name, self.date.isoformat(), f"{self.flood_level:.2f}",
+                format_cents(self.damage_cents), self.casualties, self.notes)
+
+def format_cents(cents):
+    return f"{'-' if cents < 0 else ''}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+class IncidentStore:
+    """Array-backed columns for the incidents table, kept current by the write queue."""
+
+    # numbers come back as plain ints (no Decimal/date objects): centavos, centimetres, epoch days
+    SOURCE_SQL = """
+        SELECT i.id, i.area_id, DATEDIFF(i.date, '1970-01-01'), CAST(i.flood_level * 100 AS SIGNED),
+               CAST(i.damage_estimate * 100 AS SIGNED), i.casualties, i.notes
+        FROM incidents i"""
+
+    # an area's project status is the status of its newest project
+    AREA_SQL = """
+        SELECT a.id, a.name, a.province, a.risk_level,
+               COALESCE((SELECT p.status FROM projects p WHERE p.area_id = a.id
+                         ORDER BY p.created_at DESC, p.id DESC LIMIT 1), 'No Project')
+        FROM areas a"""
+
+    def __init__(self, capacity=1024):
+        self.reset(capacity)
+
+    def reset(self, capacity=1024):
+        self.size = 0
+        self.row_of = {}                  # incident id -> row index
+        self.areas = {}                   # area id -> (name, province, risk_level, project_status)
+        self.ids = np.zeros(capacity, dtype=np.int32)
+        self.area_ids = np.zeros(capacity, dtype=np.int32)
+        self.days = np.zeros(capacity, dtype=np.int32)
+        self.levels = np.zeros(capacity, dtype=np.float32)
+        self.damage_cents = np.zeros(capacity, dtype=np.int64)
+        self.casualties = np.zeros(capacity, dtype=np.uint32)
+        self.live = np.zeros(capacity, dtype=bool)
+        self.notes = [None] * capacity
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def _grow(self, needed):
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("ids", "area_ids", "days", "levels", "damage_cents", "casualties", "live"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+        self.notes.extend([None] * (capacity - len(self.notes)))
+
+    def _put(self, row):
+        iid, aid, days, level_cm, cents, casualties, notes = row
+        idx = self.row_of.get(iid)
+        if idx is None:
+            self._grow(self.size + 1)
+            idx = self.size
+            self.size += 1
+            self.row_of[iid] = idx
+        self.ids[idx] = iid
+        self.area_ids[idx] = aid
+        self.days[idx] = days
+        self.levels[idx] = (level_cm or 0) / 100
+        self.damage_cents[idx] = cents or 0
+        self.casualties[idx] = casualties or 0
+        self.notes[idx] = notes or ""
+        self.live[idx] = True
+
+    # ---- keeping the store in step with the database ----
+    def load(self):
+        rows = fetch_rows(self.SOURCE_SQL, cache_key="incidents")
+        self.reset(max(1024, len(rows)))
+        self.refresh_areas()
+        for row in rows:
+            self._put(row)
+
+    def refresh_incident(self, iid):
+        rows = fetch_rows(self.SOURCE_SQL + " WHERE i.id = %s", (iid,))
+        if not rows:
+            self.remove(iid)
+            return
+        if rows[0][1] not in self.areas:
+            self.refresh_areas(rows[0][1])
+        self._put(rows[0])
+
+    def remove(self, iid):
+        idx = self.row_of.pop(iid, None)
+        if idx is not None:
+            self.live[idx] = False
+            self.notes[idx] = None
+
+    def refresh_areas(self, area_id=None):
+        sql, params = self.AREA_SQL, ()
+        if area_id is not None:
+            sql, params = sql + " WHERE a.id = %s", (area_id,)
+        for aid, *info in fetch_rows(sql, params, cache_key=None if area_id else "area_info"):
+            self.areas[aid] = tuple(info)
+
+    # ---- reads ----
+    def area_info(self, area_id):
+        return self.areas.get(area_id, UNKNOWN_AREA)
+
+    def _live_rows(self):
+        return np.flatnonzero(self.live[:self.size])
+
+    def get(self, iid):
+        idx = self.row_of.get(iid)
+        return None if idx is None else IncidentRow(self, idx)
+
+    def rows(self):
+        """All incidents, ordered by id."""
+        idx = self._live_rows()
+        return [IncidentRow(self, i) for i in idx[np.argsort(self.ids[idx], kind="stable")]]
+
+    def recent(self, limit=20):
+        idx = self._live_rows()
+        return [IncidentRow(self, i) for i in idx[np.argsort(-self.days[idx], kind="stable")][:limit]]
+
+    def damage_by_area(self, limit=10):
+        """[(area name, total damage in centavos)], largest first."""
+        idx = self._live_rows()
+        area_ids, inverse = np.unique(self.area_ids[idx], return_inverse=True)
+        totals = np.zeros(len(area_ids), dtype=np.int64)
+        np.add.at(totals, inverse, self.damage_cents[idx])
+        order = np.argsort(-totals, kind="stable")[:limit]
+        return [(self.area_info(int(area_ids[g]))[0], int(totals[g])) for g in order]
+
+    def avg_level_by_area(self):
+        """[(area name, average flood level)], grouped by name like the dashboard chart."""
+        idx = self._live_rows()
+        area_ids, inverse = np.unique(self.area_ids[idx], return_inverse=True)
+        sums = np.bincount(inverse, weights=self.levels[idx], minlength=len(area_ids))
+        counts = np.bincount(inverse, minlength=len(area_ids))
+        by_name = {}
+        for g, aid in enumerate(area_ids):
+            total, n = by_name.get(self.area_info(int(aid))[0], (0.0, 0))
+            by_name[self.area_info(int(aid))[0]] = (total + sums[g], n + int(counts[g]))
+        return [(name, float(total) / n) for name, (total, n) in by_name.items()]
+
+incident_store = IncidentStore()
+
+# -----------------------
+# IN-MEMORY INCIDENT CUBE (pivot / drill-down in the Reports tab)
+# -----------------------
+class IncidentCube:
+    """Dictionary-encoded dimensions over the shared store's rows (measures are read from the store)."""
+
+    DIMENSIONS = ("province", "area", "year", "month", "risk_level", "project_status")
+
+    def __init__(self, store):
+        self.store = store
+        self.reset()
+
+    def reset(self):
+        self.values = {d: [] for d in self.DIMENSIONS}      # code -> value
+        self.codes = {d: {} for d in self.DIMENSIONS}       # value -> code
+        # dims[d][i] is the code of store row i; same length as the store's columns
+        self.dims = {d: np.zeros(len(self.store.ids), dtype=np.int32) for d in self.DIMENSIONS}
+
+    def _encode(self, dim, value):
+        code = self.codes[dim].get(value)
+        if code is None:
+            code = len(self.values[dim])
+            self.codes[dim][value] = code
+            self.values[dim].append(value)
+        return code
+
+    def _grow(self):
+        capacity = len(self.store.ids)
+        for d, arr in self.dims.items():
+            if len(arr) < capacity:
+                new = np.zeros(capacity, dtype=arr.dtype)
+                new[:len(arr)] = arr
+                self.dims[d] = new
+
+    def _set_area(self, idx, area_id, province, risk_level, project_status):
+        self.dims["province"][idx] = self._encode("province", province)
+        self.dims["area"][idx] = self._encode("area", area_id)  # names repeat across provinces
+        self.dims["risk_level"][idx] = self._encode("risk_level", risk_level)
+        self.dims["project_status"][idx] = self._encode("project_status", project_status)
+
+    def _set_row(self, row):
+        """Encode the dimensions of one IncidentRow of the shared store."""
+        day = row.date
+        _, prov, risk_level, status = self.store.area_info(row.area_id)
+        self._set_area(row.idx, row.area_id, prov, risk_level, status)
+        self.dims["year"][row.idx] = self._encode("year", day.year)
+        self.dims["month"][row.idx] = self._encode("month", day.strftime("%Y-%m"))
+
+    # ---- keeping the cube in step with the shared store (refresh the store first) ----
+    def load(self):
+        self.reset()
+        for row in self.store.rows():
+            self._set_row(row)
+
+    def refresh_incident(self, iid):
+        # removals need nothing here: the store clears its live flag
+        row = self.store.get(iid)
+        if row is not None:
+            self._grow()
+            self._set_row(row)
+
+    def refresh_areas(self, area_id=None):
+        """Re-encode area attributes (province, risk, project status) in place; names are looked up when shown."""
+        store, n = self.store, self.store.size
+        for aid, (_, prov, risk_level, status) in store.areas.items():
+            if area_id is not None and aid != area_id:
+                continue
+            for idx in np.flatnonzero(store.live[:n] & (store.area_ids[:n] == aid)):
+                self._set_area(idx, aid, prov, risk_level, status)
+
+    # ---- queries ----
+    def label(self, dim, value):
+        """Display text for a group_by value; areas are grouped by id and shown by name."""
+        if dim != "area":
+            return value
+        name, province = self.store.area_info(value)[:2]
+        if sum(1 for info in self.store.areas.values() if info[0] == name) > 1:
+            return f"{name} ({province})"
+        return name
+
+    def group_by(self, dims, filters=None):
+        """Return (dim values..., incidents, total damage, casualties, avg level) per group."""
+        store, n = self.store, self.store.size
+        mask = store.live[:n].copy()
+        for dim, value in (filters or {}).items():
+            code = self.codes[dim].get(value)
+            if code is None:
+                return []
+            mask &= self.dims[dim][:n] == code
+        if not mask.any():
+            return []
+
+        # fold the group-by codes into a single int64 key per row
+        key = np.zeros(int(mask.sum()), dtype=np.int64)
+        for dim in dims:
+            key = key * len(self.values[dim]) + self.dims[dim][:n][mask]
+        groups, inverse = np.unique(key, return_inverse=True)
+        count = np.bincount(inverse, minlength=len(groups))
+        cents = np.zeros(len(groups), dtype=np.int64)
+        np.add.at(cents, inverse, store.damage_cents[:n][mask])
+        casualties = np.bincount(inverse, weights=store.casualties[:n][mask], minlength=len(groups))
+        # back to DECIMAL(5,2) values first, as IncidentRow.flood_level does, so float32 noise can't shift an average
+        level_values = np.round(store.levels[:n][mask].astype(np.float64), 2)
+        levels = np.bincount(inverse, weights=level_values, minlength=len(groups))
+
+        result = []
+        for g, k in enumerate(groups):
+            labels, rem = [], int(k)
+            for dim in reversed(dims):
+                width = len(self.values[dim])
+                labels.append(self.values[dim][rem % width])
+                rem //= width
+            labels.reverse()
+            result.append((*labels, int(count[g]), int(cents[g]) / 100, int(casualties[g]),
+                           float(levels[g]) / int(count[g])))
+        result.sort(key=lambda r: r[:len(dims)])
+        return result
+
+incident_cube = IncidentCube(incident_store)
+
+# -----------------------
+# NEAR-DUPLICATE INCIDENTS (same area, nearby date, similar notes)
+# -----------------------
+DUP_WINDOW_DAYS = 3           # reports this many days apart can still be the same flood
+DUP_SIMILARITY = 0.5          # estimated Jaccard similarity of the notes' shingles
+MINHASH_PERM = 64
+MINHASH_PRIME = (1 << 31) - 1
+_minhash_rng = np.random.RandomState(2025)  # fixed seed: signatures stay comparable between runs
+MINHASH_A = _minhash_rng.randint(1, MINHASH_PRIME, MINHASH_PERM).astype(np.uint64)
+MINHASH_B = _minhash_rng.randint(0, MINHASH_PRIME, MINHASH_PERM).astype(np.uint64)
+
+def notes_signature(notes):
+    """MinHash signature of the character 4-gram shingles of notes (None for empty notes)."""
+    text = " ".join(re.findall(r"[a-z0-9]+", (notes or "").lower()))
+    if not text:
+        return None
+    shingles = {text[i:i + 4] for i in range(max(1, len(text) - 3))}
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) % MINHASH_PRIME for s in shingles], dtype=np.uint64)
+    return ((np.outer(MINHASH_A, hashes) + MINHASH_B[:, None]) % MINHASH_PRIME).min(axis=1).astype(np.uint32)
+
+def signature_similarity(a, b):
+    if a is None or b is None:
+        return 0.0  # empty notes say nothing about whether two reports are the same flood
+    return float(np.mean(a == b))
+
+class DuplicateIndex:
+    """Blocking index on (area, date window) so each incident is only compared with its neighbours."""
+
+    def __init__(self, store):
+        self.store = store
+        self.pending = {}   # journal key -> (area_id, day, signature) of inserts not in the DB yet
+        self.reset()
+
+    def reset(self):
+        capacity = len(self.store.ids)
+        self.blocks = {}    # (area_id, day // DUP_WINDOW_DAYS) -> set of store row indices
+        # row i describes store row i; incidents without notes are never indexed
+        self.signatures = np.zeros((capacity, MINHASH_PERM), dtype=np.uint32)
+        self.block_keys = np.zeros((capacity, 2), dtype=np.int32)
+        self.indexed = np.zeros(capacity, dtype=bool)
+
+    def _grow(self):
+        capacity = len(self.store.ids)
+        if capacity <= len(self.indexed):
+            return
+        for name in ("signatures", "block_keys", "indexed"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _index(self, idx):
+        signature = notes_signature(self.store.notes[idx])
+        if signature is None:
+            return
+        key = (int(self.store.area_ids[idx]), int(self.store.days[idx]) // DUP_WINDOW_DAYS)
+        self.signatures[idx] = signature
+        self.block_keys[idx] = key
+        self.indexed[idx] = True
+        self.blocks.setdefault(key, set()).add(idx)
+
+    def _unindex(self, idx):
+        if self.indexed[idx]:
+            self.indexed[idx] = False
+            self.blocks[tuple(int(k) for k in self.block_keys[idx])].discard(idx)
+
+    # ---- keeping the index in step with the shared store (refresh the store first) ----
+    def build(self):
+        self.reset()
+        for row in self.store.rows():
+            self._index(row.idx)
+
+    def refresh_incident(self, iid):
+        idx = self.store.row_of.get(iid)
+        if idx is None:
+            # already dropped from the store; its id column still says which row it was
+            for row in np.flatnonzero(self.indexed & (self.store.ids[:len(self.indexed)] == iid)):
+                self._unindex(row)
+            return
+        self._grow()
+        self._unindex(idx)
+        self._index(idx)
+
+    def add_pending(self, key, area_id, day, notes):
+        self.pending[key] = (area_id, day, notes_signature(notes))
+
+    def remove_pending(self, key):
+        self.pending.pop(key, None)
+
+    # ---- queries ----
+    def _matches(self, area_id, day, signature, exclude=None):
+        """[(store row, notes similarity)] best first."""
+        if signature is None:
+            return []
+        bucket = day // DUP_WINDOW_DAYS
+        rows = np.array([r for b in (bucket - 1, bucket, bucket + 1)
+                         for r in self.blocks.get((area_id, b), ()) if r != exclude], dtype=np.int64)
+        if not len(rows):
+            return []
+        rows = rows[np.abs(self.store.days[rows] - day) <= DUP_WINDOW_DAYS]
+        similarity = (self.signatures[rows] == signature).mean(axis=1)
+        keep = np.flatnonzero(similarity >= DUP_SIMILARITY)
+        keep = keep[np.argsort(-similarity[keep], kind="stable")]
+        return [(int(rows[k]), float(similarity[k])) for k in keep]
+
+    def matches(self, area_id, day, notes):
+        """[(incident id, notes similarity)] of likely duplicates of a new report, best first."""
+        return [(int(self.store.ids[r]), s) for r, s in self._matches(area_id, day, notes_signature(notes))]
+
+    def pending_matches(self, area_id, day, notes):
+        """[(journal key, notes similarity)] of queued inserts that look like the same report, best first."""
+        signature = notes_signature(notes)
+        found = []
+        for key, (other_area, other_day, other_sig) in self.pending.items():
+            if other_area != area_id or abs(other_day - day) > DUP_WINDOW_DAYS:
+                continue
+            similarity = signature_similarity(signature, other_sig)
+            if similarity >= DUP_SIMILARITY:
+                found.append((key, similarity))
+        return sorted(found, key=lambda m: -m[1])
+
+    def duplicate_pairs(self):
+        """Batch pass over everything indexed: [(id, duplicate id, similarity)] with id < duplicate id."""
+        ids, pairs = self.store.ids, []
+        for idx in np.flatnonzero(self.indexed):
+            for other, similarity in self._matches(int(self.store.area_ids[idx]), int(self.store.days[idx]),
+                                                   self.signatures[idx], exclude=idx):
+                if ids[idx] < ids[other]:
+                    pairs.append((int(ids[idx]), int(ids[other]), similarity))
+        return sorted(pairs)
+
+duplicate_index = DuplicateIndex(incident_store)
+
+# -----------------------
+# OFFLINE WRITE JOURNAL (Add/Update/Delete keep working while MySQL is unreachable)
+# -----------------------
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "write_journal.jsonl")
+JOURNAL_BATCH_SIZE = 200      # writes per replay transaction
+JOURNAL_RETRY_SECONDS = 5     # replay retry interval while the DB is down
+JOURNAL_DISCARDED = "discarded by operator"  # error recorded for a write dropped from the queue
+FSYNC_BATCH = 32              # fsync after this many journal lines...
+FSYNC_INTERVAL = 0.2          # ...or this many seconds, whichever comes first
+
+class WriteJournal:
+    """Append-only local journal of DB writes, drained into MySQL by a background thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = []              # entries not yet acknowledged, oldest first
+        self.applied = queue.Queue()   # (entry, lastrowid, error) handed back to the GUI thread
+        self.wake = threading.Event()
+        self.online = True
+        self.error = None              # last replay problem that was not the link being down
+        self.stuck = None              # entry the last failed replay stopped at
+        self.discarded = set()         # keys to drop on the next replay pass
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._load()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                # torn last line from a crash mid-write: cut it off, or the next append would be glued onto it
+                f.truncate(data.rfind(b"\n") + 1)
+                os.fsync(f.fileno())
+        entries, acked = {}, set()
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # the torn line itself
+            if "ack" in rec:
+                acked.add(rec["ack"])
+            else:
+                entries[rec["key"]] = rec
+        self.pending = [entry for key, entry in entries.items() if key not in acked]
+
+    # ---- journal file (caller holds self.lock) ----
+    def _append(self, rec):
+        self.file.write(json.dumps(rec) + "\n")
+        self.file.flush()
+        self._unsynced += 1
+        if self._unsynced >= FSYNC_BATCH or time.monotonic() - self._last_sync >= FSYNC_INTERVAL:
+            self._sync()
+
+    def _sync(self):
+        if self._unsynced:
+            os.fsync(self.file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _compact(self):
+        with self.lock:
+            if self.pending or self.file.tell() == 0:
+                return
+            self.file.truncate(0)  # everything in it has been acknowledged
+            os.fsync(self.file.fileno())
+
+    # ---- public API ----
+    def submit(self, entry):
+        entry = dict(entry, key=uuid.uuid4().hex, ts=time.time())
+        with self.lock:
+            self._append(entry)
+            self.pending.append(entry)
+        self.wake.set()
+        return entry["key"]
+
+    def queued(self):
+        return len(self.pending)
+
+    def discard(self, key):
+        """Drop a queued write that keeps failing, so the ones after it can go through.
+        Done by the replay thread, which may be holding the entry in a batch right now."""
+        with self.lock:
+            self.discarded.add(key)
+        self.wake.set()
+
+    def start(self):
+        threading.Thread(target=self._run, name="journal-replayer", daemon=True).start()
+
+    # ---- replay ----
+    def _run(self):
+        global SCHEMA_READY
+        while True:
+            self.wake.wait(JOURNAL_RETRY_SECONDS)
+            self.wake.clear()
+            try:
+                self._drop_discarded()
+                with self.lock:
+                    self._sync()
+                if not SCHEMA_READY:  # the app was started during an outage
+                    ensure_schema_and_seed()
+                    SCHEMA_READY = True
+                self.drain()
+                self.online, self.error, self.stuck = True, None, None
+            except mysql.connector.Error as err:
+                # link down, or a transient server error (lock wait, deadlock): entries stay queued
+                self.online = not is_connection_error(err)
+                self.error = None if not self.online else str(err)
+            except Exception as err:
+                # never let the replayer die quietly (e.g. fsync failing); keep retrying
+                self.error = f"{type(err).__name__}: {err}"
+                traceback.print_exc()
+
+    def _drop_discarded(self):
+        with self.lock:
+            dropped = [entry for entry in self.pending if entry["key"] in self.discarded]
+            for entry in dropped:
+                self._append({"ack": entry["key"], "ok": False})
+            self._sync()
+            self.pending = [entry for entry in self.pending if entry["key"] not in self.discarded]
+            self.discarded.clear()
+        for entry in dropped:
+            self.applied.put((entry, None, JOURNAL_DISCARDED))
+
+    def drain(self):
+        while True:
+            with self.lock:
+                batch = self.pending[:JOURNAL_BATCH_SIZE]
+            if not batch:
+                self._compact()
+                return
+            results = self._apply(batch)
+            with self.lock:
+                for entry, _, error in results:
+                    self._append({"ack": entry["key"], "ok": error is None})
+                self._sync()
+                del self.pending[:len(batch)]
+            for result in results:
+                self.applied.put(result)
+
+    def _apply(self, batch):
+        """Apply a batch in one transaction; rejected rows are rolled back individually."""
+        conn = get_connection()
+        cur = conn.cursor()
+        results = []
+        try:
+            conn.start_transaction()
+            for entry in batch:
+                cur.execute("SAVEPOINT journal_entry")
+                try:
+                    cur.execute("INSERT IGNORE INTO applied_writes (idem_key) VALUES (%s)", (entry["key"],))
+                    if cur.rowcount == 0:
+                        # committed before, but the ack never reached the journal
+                        results.append((entry, None, None))
+                        continue
+                    cur.execute(entry["sql"], entry["params"])
+                    results.append((entry, cur.lastrowid if entry["op"] == "insert" else None, None))
+                except mysql.connector.Error as err:
+                    if is_retryable(err):  # link drop, lock wait timeout, deadlock: retry the whole batch
+                        self.stuck = entry
+                        raise
+                    # the row itself is bad (duplicate, truncated value, bad ENUM, ...): reject it, keep the rest
+                    cur.execute("ROLLBACK TO SAVEPOINT journal_entry")
+                    results.append((entry, None, str(err)))
+            conn.commit()
+        except mysql.connector.Error:
+            try:
+                conn.rollback()
+            except mysql.connector.Error:
+                pass
+            raise
+        finally:
+            cur.close(); conn.close()
+        return results
+
+# -----------------------
+# REPORT REGISTRY: parameterized query definitions (date range, province, limit)
+# -----------------------
+# "from" always joins areas as `a` when a province filter makes sense; "equals" are fixed
+# filters, bound as parameters like everything else. "province": False marks a definition
+# without that join, "by_province": False one that can't be split per province.
+REPORTS = {
+    "Top Damage Areas": {
+        "select": "a.name, SUM(i.damage_estimate) AS total_damage",
+        "from": "areas a JOIN incidents i ON a.id=i.area_id",
+        "date_column": "i.date", "group_by": "a.id", "order_by": "total_damage DESC", "limit": 10,
+        "headers": ("Area", "Total Damage (PHP)"), "chart": "bar", "ylabel": "Damage (PHP)"},
+    "Recent Incidents": {
+        "select": "i.id, a.name, i.date, i.flood_level, i.damage_estimate",
+        "from": "incidents i JOIN areas a ON i.area_id=a.id",
+        "date_column": "i.date", "order_by": "i.date DESC", "limit": 20,
+        "headers": ("ID", "Area", "Date", "Level(m)", "Damage"), "chart": None},
+    "Delayed Projects": {
+        "select": "p.id, p.project_name, a.name, p.start_date, p.end_date, p.status",
+        "from": "projects p JOIN areas a ON p.area_id=a.id", "equals": {"p.status": "Delayed"},
+        "date_column": "p.start_date", "order_by": "p.start_date",
+        "headers": ("ID", "Project", "Area", "Start", "End", "Status"), "chart": None},
+    "Project Status Distribution": {
+        "select": "p.status, COUNT(*)",
+        "from": "projects p JOIN areas a ON p.area_id=a.id",
+        "date_column": "p.start_date", "group_by": "p.status", "order_by": "p.status", "rollup": True,
+        "headers": ("Status", "Count"), "chart": "pie"},
+    "Average Flood Level per Area": {
+        "select": "a.name, AVG(i.flood_level)",
+        "from": "incidents i JOIN areas a ON i.area_id = a.id",
+        "date_column": "i.date", "group_by": "a.id", "order_by": "a.name",
+        "headers": ("Area", "Avg Flood Level (m)"), "chart": "bar", "ylabel": "Flood Level (meters)"},
+}
+
+# dashboard KPI counts; date_to is the "since" cutoff of the KPI cards
+KPIS = {
+    "Total Areas": {"select": "COUNT(*)", "from": "areas a", "date_column": "a.created_at", "by_province": False},
+    "Total Projects": {"select": "COUNT(*)", "from": "projects p", "date_column": "p.created_at", "province": False},
+    "Total Incidents": {"select": "COUNT(*)", "from": "incidents i", "date_column": "i.created_at", "province": False},
+    "High Risk Areas": {"select": "COUNT(*)", "from": "areas a", "equals": {"a.risk_level": "High"},
+                        "date_column": "a.created_at", "by_province": False},
+}
+
+def supports(definition, param):
+    """Whether build_query accepts the province / by_province parameter for this definition."""
+    if param == "by_province" and not definition.get("by_province", True):
+        return False
+    return definition.get("province", True)
+
+def build_query(definition, province=None, date_from=None, date_to=None, limit=None, by_province=False):
+    """SQL + params for a registry definition. by_province prepends a.province; a LIMIT then
+    applies per province and the rank within the province comes back as an extra last column."""
+    for param, value in (("province", province is not None), ("by_province", by_province)):
+        if value and not supports(definition, param):
+            raise ValueError(f"{param} is not supported for {definition['from']!r}")
+    select, group_by = definition["select"], definition.get("group_by")
+    order_by = definition.get("order_by")
+    limit = definition.get("limit") if limit is None else limit
+    if by_province:
+        select = "a.province, " + select
+        group_by = group_by and "a.province, " + group_by
+    if by_province and limit:
+        # top-N per province in one pass instead of fetching every row and cutting in Python
+        window = "PARTITION BY a.province"
+        if order_by:
+            for expr, alias in re.findall(r"(\S+\(.*?\))\s+AS\s+(\w+)", select):
+                order_by = re.sub(rf"\b{alias}\b", expr, order_by)  # window ORDER BY can't see select aliases
+            window += f" ORDER BY {order_by}"
+        select += f", ROW_NUMBER() OVER ({window}) AS province_rank"
+    where, params = [], []
+    for column, value in definition.get("equals", {}).items():
+        where.append(f"{column} = %s"); params.append(value)
+    if province is not None:
+        where.append("a.province = %s"); params.append(province)
+    if date_from is not None:
+        where.append(f"{definition['date_column']} >= %s"); params.append(date_from)
+    if date_to is not None:
+        where.append(f"{definition['date_column']} <= %s"); params.append(date_to)
+    sql = f"SELECT {select} FROM {definition['from']}"
+    if where: sql += " WHERE " + " AND ".join(where)
+    if group_by: sql += f" GROUP BY {group_by}"
+    if by_province and limit:
+        sql = f"SELECT * FROM ({sql}) ranked WHERE province_rank <= %s ORDER BY province, province_rank"
+        params.append(int(limit))
+    elif limit:
+        if order_by: sql += f" ORDER BY {order_by}"
+        sql += " LIMIT %s"; params.append(int(limit))
+    elif order_by:
+        sql += f" ORDER BY {order_by}"
+    return sql, tuple(params)
+
+def fetch_report(name, **params):
+    return fetch_rows(*build_query(REPORTS[name], **params))
+
+def fetch_kpi(name, **params):
+    cache_key = "kpi_" + slugify(f"{name} {sorted(params.items())}")
+    return fetch_rows(*build_query(KPIS[name], **params), cache_key=cache_key)[0][0]
+
+# -----------------------
+# HEADLESS BATCH: report packs for every province (Agg backend, process pool)
+# -----------------------
+# Each report is fetched once for the whole country (first column = province) and then
+# split per province in memory; only the rendering is fanned out to the workers. Top-N
+# reports come back already cut per province, so their national page is its own query.
+NATIONAL = "All Provinces"
+
+def slugify(text):
+    return re.sub(r"[^A-Za-z0-9]+", "_", str(text)).strip("_").lower()
+
+def unique_slugs(names):
+    """name -> directory name; empty or colliding slugs get a numeric suffix."""
+    slugs, used = {}, set()
+    for name in names:
+        base = slugify(name) or "province"
+        slug, n = base, 1
+        while slug in used:
+            n += 1
+            slug = f"{base}_{n}"
+        used.add(slug)
+        slugs[name] = slug
+    return slugs
+
+def rollup_rows(rows):
+    """Sum the last column over identical leading columns (province counts -> national)."""
+    totals = {}
+    for row in rows:
+        totals[row[:-1]] = totals.get(row[:-1], 0) + row[-1]
+    return [(*key, total) for key, total in totals.items()]
+
+def render_report_job(job):
+    """Write one report as CSV + PNG + PDF. Runs in a pool worker, so no Tk and no pyplot.
+    A failing job comes back with an "error" instead of taking the whole pack down."""
+    started = time.perf_counter()
+    base = os.path.join(job["out_dir"], slugify(job["name"]))
+    result = {"report": job["name"], "province": job["province"], "rows": len(job["rows"]),
+              "path": os.path.relpath(base, job["pack_dir"]), "error": ""}
+    try:
+        write_report_files(job, base)
+    except Exception as err:
+        result["error"] = f"{type(err).__name__}: {err}"
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+def write_report_files(job, base):
+    name, report, province, rows = job["name"], job["report"], job["province"], job["rows"]
+    os.makedirs(job["out_dir"], exist_ok=True)
+    title = f"{name} - {province}"
+
+    with open(base + ".csv", "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(report["headers"])
+        w.writerows(rows)
+
+    fig = Figure(figsize=(8, 4))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    if not rows:
+        ax.axis("off")
+        ax.text(0.5, 0.5, "No data", ha="center", va="center")
+    elif report["chart"] in ("bar", "pie"):
+        # charted reports are (label, ..., value); table-only ones can end in text columns
+        labels = [str(r[0]) for r in rows]
+        values = [float(r[-1] or 0) for r in rows]
+        if report["chart"] == "bar":
+            ax.bar(labels, values, color="#3b8ed0")
+            ax.set_ylabel(report.get("ylabel", ""))
+            ax.tick_params(axis='x', rotation=45, labelsize=9)
+        else:
+            ax.pie(values, labels=labels, autopct='%1.1f%%', startangle=90)
+    else:
+        ax.axis("off")
+        ax.table(cellText=[[str(v) for v in r] for r in rows], colLabels=report["headers"], loc="center")
+    ax.set_title(title)
+    fig.tight_layout()
+    fig.savefig(base + ".png", dpi=120)
+    fig.savefig(base + ".pdf")
+
+def build_batch_jobs(pack_dir):
+    jobs, fetch_times = [], {}
+    provinces = [r[0] for r in fetch_rows("SELECT DISTINCT province FROM areas ORDER BY province")]
+    dirs = unique_slugs([NATIONAL] + provinces)
+    for name, report in REPORTS.items():
+        started = time.perf_counter()
+        rows = fetch_report(name, by_province=True)
+        ranked = bool(report.get("limit"))
+        by_province = {p: [] for p in provinces}  # provinces without data still get an (empty) report
+        for row in rows:
+            if row[0] in by_province:  # skip areas added since the province list was read
+                by_province[row[0]].append(tuple(row[1:-1] if ranked else row[1:]))
+        if ranked:
+            national = [tuple(r) for r in fetch_report(name)]
+        else:
+            national = [tuple(r[1:]) for r in rows]
+        if report.get("rollup"):
+            national = rollup_rows(national)
+        fetch_times[name] = time.perf_counter() - started
+        by_province[NATIONAL] = national
+        for province, prov_rows in by_province.items():
+            jobs.append({"name": name, "report": report, "province": province, "pack_dir": pack_dir,
+                         "rows": prov_rows, "out_dir": os.path.join(pack_dir, dirs[province])})
+    return jobs, fetch_times
+
+def run_batch(out_dir, workers=None):
+    started = time.perf_counter()
+    pack_dir = os.path.join(out_dir, datetime.now().strftime("pack_%Y%m%d_%H%M%S"))
+    jobs, fetch_times = build_batch_jobs(pack_dir)
+    for name, secs in fetch_times.items():
+        print(f"fetch  {name:<32} {secs:7.3f}s")
+
+    # spawned workers would re-run this whole script (and build the GUI), so use
+    # fork where the platform has it and threads otherwise; the jobs never touch pyplot
+    if "fork" in multiprocessing.get_all_start_methods():
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+    with pool:
+        results = list(pool.map(render_report_job, jobs))
+
+    os.makedirs(pack_dir, exist_ok=True)
+    with open(os.path.join(pack_dir, "index.csv"), "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(("Province", "Report", "Rows", "CSV", "PNG", "PDF", "Seconds", "Error"))
+        for r in sorted(results, key=lambda r: (r["province"], r["report"])):
+            w.writerow((r["province"], r["report"], r["rows"], r["path"] + ".csv", r["path"] + ".png",
+                        r["path"] + ".pdf", f"{r['seconds']:.3f}", r["error"]))
+            print(f"render {r['province'] + ' / ' + r['report']:<60} {r['seconds']:7.3f}s {r['error']}")
+    failed = sum(1 for r in results if r["error"])
+    print(f"{len(results) - failed} reports written to {pack_dir} in {time.perf_counter() - started:.1f}s"
+          + (f", {failed} failed (see index.csv)" if failed else ""))
+    return pack_dir
+
+# -----------------------
+# HEADLESS INDEX ADVISOR: EXPLAIN every registry query on a generated dataset
+# -----------------------
+FULL_SCAN_MIN_ROWS = 1000           # smaller full scans (e.g. of areas) are not worth an index
+MAX_INDEX_COLUMNS = 5
+UNINDEXED_COLUMNS = {"notes", "remarks"}  # TEXT columns can't go into a plain composite index
+
+def generate_dataset(conn, incidents, seed=7):
+    """Fill the (scratch) database with a deterministic, realistically skewed dataset."""
+    rng = random.Random(seed)
+    cur = conn.cursor()
+    n_areas = max(50, incidents // 100)
+    cur.executemany("INSERT INTO areas (name,province,risk_level,population_affected) VALUES (%s,%s,%s,%s)",
+                    [(f"Area {n:05d}", f"Province {n % 80:02d}", rng.choice(("High", "Medium", "Low")),
+                      rng.randrange(1000, 2000000)) for n in range(n_areas)])
+    cur.execute("SELECT id FROM areas")
+    area_ids = [r[0] for r in cur.fetchall()]
+    def some_day():
+        return date(2015, 1, 1) + timedelta(days=rng.randrange(3650))
+    projects = []
+    for n in range(max(10, incidents // 10)):
+        start = some_day()
+        projects.append((f"Project {n}", rng.choice(area_ids), start, start + timedelta(days=rng.randrange(30, 720)),
+                         rng.choice(("Ongoing", "Ongoing", "Delayed", "Completed")), "generated"))
+    cur.executemany("INSERT INTO projects (project_name,area_id,start_date,end_date,status,remarks) VALUES (%s,%s,%s,%s,%s,%s)",
+                    projects)
+    for chunk in range(0, incidents, 5000):
+        cur.executemany("INSERT INTO incidents (area_id,date,flood_level,damage_estimate,casualties,notes) VALUES (%s,%s,%s,%s,%s,%s)",
+                        [(rng.choice(area_ids), some_day(), round(rng.uniform(0.1, 6), 2), round(rng.expovariate(1 / 500000), 2),
+                          rng.choice((0, 0, 0, 1, 2, 5)), "generated") for _ in range(min(5000, incidents - chunk))])
+        conn.commit()
+    cur.execute("ANALYZE TABLE areas, projects, incidents"); cur.fetchall()
+    cur.close()
+
+def explain(cur, sql, params):
+    cur.execute("EXPLAIN " + sql, params)
+    return cur.fetchall()
+
+def plan_tables(plan):
+    """Plan rows that read a table; "Select tables optimized away" and "Impossible WHERE" have none."""
+    return [row for row in plan if row["table"]]
+
+def plan_flags(plan):
+    flags = []
+    for row in plan_tables(plan):
+        extra = row.get("Extra") or ""
+        # a materialized subquery (the per-province top-N) is always read in full
+        derived = row["table"].startswith("<derived")
+        if row["type"] == "ALL" and not derived and (row["rows"] or 0) >= FULL_SCAN_MIN_ROWS:
+            flags.append(f"full scan of {row['table']}")
+        if "Using filesort" in extra: flags.append("filesort")
+        if "Using temporary" in extra: flags.append("temporary table")
+    return flags
+
+def plan_summary(plan):
+    return ", ".join(f"{r['table']}:{r['type']}/{r['key'] or '-'}" for r in plan_tables(plan)) or "no tables read"
+
+def plan_improved(before, after):
+    rows_before = sum(r["rows"] or 0 for r in plan_tables(before))
+    rows_after = sum(r["rows"] or 0 for r in plan_tables(after))
+    return len(plan_flags(after)) < len(plan_flags(before)) or rows_after * 2 <= rows_before
+
+def candidate_index(definition, alias, params):
+    """Columns for a composite/covering index on one table: equality filters, then the range or
+    sort column, then every other column the query reads from that table."""
+    def refs(text): return re.findall(rf"\b{alias}\.(\w+)", text or "")
+    leading = [c.split(".")[1] for c in definition.get("equals", {}) if c.startswith(alias + ".")]
+    if alias == "a" and (params.get("province") or params.get("by_province")):
+        leading.append("province")
+    date_column = definition.get("date_column", "")
+    if date_column.startswith(alias + ".") and (params.get("date_from") or params.get("date_to")):
+        leading.append(date_column.split(".")[1])
+    else:
+        leading += (refs(definition.get("order_by")) or refs(definition.get("group_by")))[:1]
+    # join columns first, so a table reached through the join can be looked up by them
+    covering = refs(definition["from"]) + refs(definition["select"]) + refs(definition.get("group_by"))
+    cols = []
+    for col in leading + covering:
+        if col not in cols and col != "id" and col not in UNINDEXED_COLUMNS:  # InnoDB adds the PK itself
+            cols.append(col)
+    return cols[:MAX_INDEX_COLUMNS]
+
+def index_exists(cur, table, cols):
+    cur.execute(f"SHOW INDEX FROM {table}")
+    indexes = {}
+    for row in cur.fetchall():
+        indexes.setdefault(row["Key_name"], []).append((row["Seq_in_index"], row["Column_name"]))
+    return any([c for _, c in sorted(idx)][:len(cols)] == cols for idx in indexes.values())
+
+def explain_param_sets(definition, province):
+    """Parameter combinations to EXPLAIN, including the by_province queries --batch runs."""
+    dates = {"date_from": "2020-01-01", "date_to": "2020-12-31"}
+    sets = [{}]
+    if supports(definition, "province"):
+        sets.append({"province": province})
+    if supports(definition, "by_province"):
+        sets.append({"by_province": True})  # what --batch runs
+    if definition.get("date_column"):
+        sets += [dict(s, **dates) for s in sets]
+    return sets
+
+def write_index_migration(proposals):
+    os.makedirs(MIGRATIONS_DIR, exist_ok=True)
+    existing = sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith(".sql"))
+    number = int(existing[-1].split("_")[0]) + 1 if existing else 1
+    path = os.path.join(MIGRATIONS_DIR, f"{number:04d}_report_indexes.sql")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"-- generated by --advise-indexes on {datetime.now():%Y-%m-%d %H:%M}\n")
+        for table, index, cols in proposals:
+            f.write(f"CREATE INDEX {index} ON {table} ({', '.join(cols)});\n")
+    return path
+
+def advise_indexes(incidents=50000, apply=False):
+    """EXPLAIN every report/KPI query on a scratch copy, try an index for each flagged plan and
+    keep the ones that EXPLAIN shows actually help. With apply, ship them as a migration."""
+    real_db = DB_CONFIG["database"]
+    DB_CONFIG["database"] = real_db + "_explain"  # everything below runs on the scratch database
+    try:
+        conn = get_connection(create_if_missing=True)
+        cur = conn.cursor()
+        for table in ("incidents", "projects", "areas", "schema_migrations", "applied_writes"):
+            cur.execute(f"DROP TABLE IF EXISTS {table}")
+        cur.close(); conn.close()
+        ensure_schema_and_seed()  # same schema + migrations as production
+        conn = get_connection()
+        print(f"generating {incidents} incidents in {DB_CONFIG['database']} ...")
+        generate_dataset(conn, incidents)
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT province FROM areas ORDER BY province LIMIT 1")
+        province = cur.fetchone()["province"]
+
+        proposals = []
+        for name, definition in list(REPORTS.items()) + list(KPIS.items()):
+            aliases = re.findall(r"(?:^|JOIN\s+)(\w+)\s+(\w+)", definition["from"])
+            for params in explain_param_sets(definition, province):
+                sql, args = build_query(definition, **params)
+                plan = explain(cur, sql, args)
+                flags = plan_flags(plan)
+                print(f"{name} {params or ''}: {plan_summary(plan)} {'[' + ', '.join(flags) + ']' if flags else 'ok'}")
+                if not flags:
+                    continue
+                for table, alias in aliases:
+                    cols = candidate_index(definition, alias, params)
+                    if not cols or index_exists(cur, table, cols):
+                        continue
+                    index = f"idx_{table}_{'_'.join(cols)}"[:64]
+                    cur.execute(f"CREATE INDEX {index} ON {table} ({', '.join(cols)})")
+                    cur.execute(f"ANALYZE TABLE {table}"); cur.fetchall()
+                    after = explain(cur, sql, args)
+                    if plan_improved(plan, after):
+                        proposals.append((table, index, cols))
+                        print(f"    + {index}: {plan_summary(after)} {plan_flags(after) or 'ok'}")
+                        plan = after
+                    else:
+                        cur.execute(f"DROP INDEX {index} ON {table}")
+        cur.close(); conn.close()
+    finally:
+        DB_CONFIG["database"] = real_db
+
+    if not proposals:
+        print("no index changes proposed")
+        return None
+    print("proposed:")
+    for table, index, cols in proposals:
+        print(f"  CREATE INDEX {index} ON {table} ({', '.join(cols)});")
+    if not apply:
+        return None
+    path = write_index_migration(proposals)
+    conn = get_connection()
+    apply_migrations(conn)
+    conn.close()
+    print(f"wrote and applied {path}")
+    return path
+
+if HEADLESS:
+    parser = argparse.ArgumentParser(description="Headless tools: report packs and index advice, without the GUI.")
+    parser.add_argument("--batch", metavar="OUT_DIR", help="render every report for every province into OUT_DIR")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--advise-indexes", action="store_true",
+                        help="EXPLAIN every report on a generated dataset and propose indexes")
+    parser.add_argument("--rows", type=int, default=50000, help="incidents to generate for --advise-indexes")
+    parser.add_argument("--apply", action="store_true", help="write the proposed indexes as a migration and apply it")
+    args = parser.parse_args()
+    if args.advise_indexes:
+        advise_indexes(args.rows, args.apply)
+    if args.batch:
+        run_batch(args.batch, args.jobs)
+    sys.exit(0)
 
 # -----------------------
 # UI: CustomTkinter App
@@ -209,6 +1348,9 @@ ctk.CTkButton(sidebar_frame, text="🏗 Projects", command=lambda: go_to_tab("Pr
 ctk.CTkButton(sidebar_frame, text="⚠ Incidents", command=lambda: go_to_tab("Incidents")).pack(fill="x", padx=10, pady=5)
 ctk.CTkButton(sidebar_frame, text="📝 Reports", command=lambda: go_to_tab("Reports")).pack(fill="x", padx=10, pady=5)
 ctk.CTkLabel(sidebar_frame, text="Version 1.0", text_color="gray").pack(side="bottom", pady=10)
+queued_writes_label = ctk.CTkLabel(sidebar_frame, text="Queued writes: 0", text_color="gray")
+queued_writes_label.pack(side="bottom", pady=(0, 4))
+queued_writes_label.bind("<Button-1>", lambda event: discard_stuck_write())
 
 # ============================
 # SIDEBAR TOGGLE BUTTON
@@ -234,15 +1376,17 @@ tabview.add("Projects")
 tabview.add("Incidents")
 tabview.add("Reports")
 
-# ----- Utility: run a SELECT and return rows -----
-def fetch_rows(sql, params=None):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(sql, params or ())
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+def run_offline_tolerant(func):
+    """Call func; if the DB is unreachable and nothing is cached yet, keep what is shown."""
+    try:
+        func()
+    except mysql.connector.Error as err:
+        if not is_connection_error(err): raise
+
+# shared in-memory incident data: loaded once here, then kept current by the write queue
+run_offline_tolerant(incident_store.load)
+incident_cube.load()
+duplicate_index.build()
 
 # ============================
 # DASHBOARD TAB
@@ -260,18 +1404,18 @@ REFRESH_INTERVAL = 5000  # milliseconds (5000 ms = 5 seconds)
 def refresh_dashboard():
 
     # ---- Fetch Current KPIs ----
-    total_areas = fetch_rows("SELECT COUNT(*) FROM areas")[0][0]
-    total_projects = fetch_rows("SELECT COUNT(*) FROM projects")[0][0]
-    total_incidents = fetch_rows("SELECT COUNT(*) FROM incidents")[0][0]
-    high_risk = fetch_rows("SELECT COUNT(*) FROM areas WHERE risk_level='High'")[0][0]
+    total_areas = fetch_kpi("Total Areas")
+    total_projects = fetch_kpi("Total Projects")
+    total_incidents = len(incident_store)
+    high_risk = fetch_kpi("High Risk Areas")
 
     # ---- Fetch KPIs since 2025-12-01 for automatic summary ----
     date_cutoff = "2025-01-01"
 
-    areas_after_date = fetch_rows(f"SELECT COUNT(*) FROM areas WHERE created_at <= '{date_cutoff}'")[0][0]
-    projects_after_date = fetch_rows(f"SELECT COUNT(*) FROM projects WHERE created_at <= '{date_cutoff}'")[0][0]
-    incidents_after_date = fetch_rows(f"SELECT COUNT(*) FROM incidents WHERE created_at <= '{date_cutoff}'")[0][0]
-    high_risk_after_date = fetch_rows(f"SELECT COUNT(*) FROM areas WHERE risk_level='High' AND created_at <= '{date_cutoff}'")[0][0]
+    areas_after_date = fetch_kpi("Total Areas", date_to=date_cutoff)
+    projects_after_date = fetch_kpi("Total Projects", date_to=date_cutoff)
+    incidents_after_date = fetch_kpi("Total Incidents", date_to=date_cutoff)
+    high_risk_after_date = fetch_kpi("High Risk Areas", date_to=date_cutoff)
 
     # ---- Function to calculate summary and color ----
     def calculate_summary_and_color(current, after_date, positive_is_good=True):
@@ -330,12 +1474,7 @@ except:
 chart_frame = ctk.CTkFrame(dashboard_tab)
 chart_frame.pack(fill="both", expand=True, padx=20, pady=10)
 
-inc_data = fetch_rows("""
-    SELECT a.name, AVG(i.flood_level)
-    FROM incidents i 
-    JOIN areas a ON i.area_id = a.id
-    GROUP BY a.name
-""")
+inc_data = incident_store.avg_level_by_area()
 
 if inc_data:
     areas = [row[0] for row in inc_data]
@@ -354,7 +1493,7 @@ if inc_data:
 dashboard_tab.after(REFRESH_INTERVAL, refresh_dashboard)
 
 # Start auto-refresh
-refresh_dashboard()
+run_offline_tolerant(refresh_dashboard)
 
 # -----------------------
 # AREAS TAB (form top, table middle, buttons bottom)
@@ -398,7 +1537,7 @@ area_btn_frame.grid_columnconfigure((0,1,2,3), weight=1)
 
 def refresh_area_table():
     for r in area_tree.get_children(): area_tree.delete(r)
-    rows = fetch_rows("SELECT id,name,province,risk_level,population_affected FROM areas ORDER BY id ASC")
+    rows = fetch_rows("SELECT id,name,province,risk_level,population_affected FROM areas ORDER BY id ASC", cache_key="areas_table")
     for row in rows:
         area_tree.insert("", "end", values=row)
     # refresh combos in other tabs
@@ -408,22 +1547,16 @@ def area_add():
     if not area_name.get() or not province.get():
         messagebox.showwarning("Missing", "Fill Area name and Province")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("INSERT INTO areas (name,province,risk_level,population_affected) VALUES (%s,%s,%s,%s)",
+    queue_write("areas", "insert", "INSERT INTO areas (name,province,risk_level,population_affected) VALUES (%s,%s,%s,%s)",
                 (area_name.get(), province.get(), risk.get() or "Medium", population.get() or 0))
-    conn.commit(); cur.close(); conn.close()
-    refresh_area_table()
 
 def area_update():
     sel = area_tree.focus()
     if not sel: messagebox.showwarning("Select", "Choose an area"); return
     vals = area_tree.item(sel)["values"]
     aid = vals[0]
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE areas SET name=%s, province=%s, risk_level=%s, population_affected=%s WHERE id=%s",
-                (area_name.get(), province.get(), risk.get() or "Medium", population.get() or 0, aid))
-    conn.commit(); cur.close(); conn.close()
-    refresh_area_table()
+    queue_write("areas", "update", "UPDATE areas SET name=%s, province=%s, risk_level=%s, population_affected=%s WHERE id=%s",
+                (area_name.get(), province.get(), risk.get() or "Medium", population.get() or 0, aid), ref=aid)
 
 def area_delete():
     sel = area_tree.focus()
@@ -432,15 +1565,8 @@ def area_delete():
     aid = vals[0]
     if not messagebox.askyesno("Confirm", f"Delete area ID {aid}? This will block if projects/incidents reference it."):
         return
-    conn = get_connection(); cur = conn.cursor()
-    try:
-        cur.execute("DELETE FROM areas WHERE id=%s", (aid,))
-        conn.commit()
-    except mysql.connector.IntegrityError:
-        messagebox.showerror("Integrity", "Area is referenced by projects or incidents. Delete dependent rows first.")
-    finally:
-        cur.close(); conn.close()
-    refresh_area_table()
+    queue_write("areas", "delete", "DELETE FROM areas WHERE id=%s", (aid,), ref=aid,
+                error_hint="Area is referenced by projects or incidents. Delete dependent rows first.")
 
 def area_on_select(event):
     sel = area_tree.focus()
@@ -501,7 +1627,7 @@ proj_btn_frame.grid_columnconfigure((0,1,2,3), weight=1)
 def refresh_proj_table():
     for r in proj_tree.get_children(): proj_tree.delete(r)
     rows = fetch_rows("""SELECT p.id, p.project_name, a.name, p.start_date, p.end_date, p.status, p.remarks
-                        FROM projects p JOIN areas a ON p.area_id=a.id ORDER BY p.created_at DESC""")
+                        FROM projects p JOIN areas a ON p.area_id=a.id ORDER BY p.created_at DESC""", cache_key="projects_table")
     for row in rows: proj_tree.insert("", "end", values=row)
 
 def proj_add():
@@ -509,32 +1635,23 @@ def proj_add():
         messagebox.showwarning("Missing", "Project name and Area are required")
         return
     area_id = int(proj_area.get().split("ID:")[-1].replace(")",""))
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("INSERT INTO projects (project_name,area_id,start_date,end_date,status,remarks) VALUES (%s,%s,%s,%s,%s,%s)",
+    queue_write("projects", "insert", "INSERT INTO projects (project_name,area_id,start_date,end_date,status,remarks) VALUES (%s,%s,%s,%s,%s,%s)",
                 (proj_name.get(), area_id, proj_start.get() or None, proj_end.get() or None, proj_status.get() or "Ongoing", proj_remarks.get()))
-    conn.commit(); cur.close(); conn.close()
-    refresh_proj_table()
 
 def proj_update():
     sel = proj_tree.focus()
     if not sel: messagebox.showwarning("Select", "Pick a project"); return
     pid = proj_tree.item(sel)["values"][0]
     area_id = int(proj_area.get().split("ID:")[-1].replace(")",""))
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE projects SET project_name=%s, area_id=%s, start_date=%s, end_date=%s, status=%s, remarks=%s WHERE id=%s",
-                (proj_name.get(), area_id, proj_start.get() or None, proj_end.get() or None, proj_status.get() or "Ongoing", proj_remarks.get(), pid))
-    conn.commit(); cur.close(); conn.close()
-    refresh_proj_table()
+    queue_write("projects", "update", "UPDATE projects SET project_name=%s, area_id=%s, start_date=%s, end_date=%s, status=%s, remarks=%s WHERE id=%s",
+                (proj_name.get(), area_id, proj_start.get() or None, proj_end.get() or None, proj_status.get() or "Ongoing", proj_remarks.get(), pid), ref=pid)
 
 def proj_delete():
     sel = proj_tree.focus()
     if not sel: return
     pid = proj_tree.item(sel)["values"][0]
     if not messagebox.askyesno("Confirm", f"Delete project {pid}?"): return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("DELETE FROM projects WHERE id=%s", (pid,))
-    conn.commit(); cur.close(); conn.close()
-    refresh_proj_table()
+    queue_write("projects", "delete", "DELETE FROM projects WHERE id=%s", (pid,), ref=pid)
 
 def proj_on_select(event):
     sel = proj_tree.focus()
@@ -597,37 +1714,54 @@ inc_btn_frame.grid_columnconfigure((0,1,2,3), weight=1)
 
 def refresh_inc_table():
     for r in inc_tree.get_children(): inc_tree.delete(r)
-    rows = fetch_rows("""SELECT i.id, a.name, i.date, i.flood_level, i.damage_estimate, i.casualties, i.notes
-                        FROM incidents i JOIN areas a ON i.area_id = a.id ORDER BY id ASC""")
-    for row in rows: inc_tree.insert("", "end", values=row)
+    for row in incident_store.rows(): inc_tree.insert("", "end", values=row.values())
 
 def inc_add():
     if not inc_area.get() or not inc_date.get(): messagebox.showwarning("Missing", "Area and date required"); return
     aid = int(inc_area.get().split("ID:")[-1].replace(")",""))
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("INSERT INTO incidents (area_id,date,flood_level,damage_estimate,casualties,notes) VALUES (%s,%s,%s,%s,%s,%s)",
+    if check_duplicate_incident(aid): return
+    queue_write("incidents", "insert", "INSERT INTO incidents (area_id,date,flood_level,damage_estimate,casualties,notes) VALUES (%s,%s,%s,%s,%s,%s)",
                 (aid, inc_date.get(), float(inc_level.get() or 0), float(inc_damage.get() or 0), int(inc_casualties.get() or 0), inc_notes.get()))
-    conn.commit(); cur.close(); conn.close()
-    refresh_inc_table()
+
+def check_duplicate_incident(aid):
+    """Offer to merge a likely duplicate into the existing incident. True if nothing more should be saved."""
+    try:
+        day = (datetime.strptime(inc_date.get(), "%Y-%m-%d").date() - EPOCH).days
+    except ValueError:
+        return False  # leave bad dates to the DB to reject
+    found = duplicate_index.matches(aid, day, inc_notes.get())
+    if not found:
+        queued = duplicate_index.pending_matches(aid, day, inc_notes.get())
+        if not queued: return False
+        # the other report hasn't reached the DB yet, so there is no row to merge into
+        return not messagebox.askyesno("Possible duplicate",
+            f"This looks like a report still waiting to be saved (notes {queued[0][1]:.0%} similar).\n\nSave it anyway?")
+    dup, similarity = incident_store.get(found[0][0]), found[0][1]
+    answer = messagebox.askyesnocancel("Possible duplicate",
+        f"This looks like incident #{dup.id} ({dup.area_name}, {dup.date}, notes {similarity:.0%} similar).\n\n"
+        f"Yes: merge into #{dup.id}\nNo: save as a new incident\nCancel: don't save")
+    if answer is None: return True
+    if not answer: return False
+    # same flood reported twice: keep the worst-case figures rather than adding them up
+    queue_write("incidents", "update", """UPDATE incidents SET flood_level=GREATEST(flood_level,%s), damage_estimate=GREATEST(damage_estimate,%s),
+                casualties=GREATEST(casualties,%s), notes=CONCAT_WS(' | ', NULLIF(notes,''), NULLIF(%s,'')) WHERE id=%s""",
+                (float(inc_level.get() or 0), float(inc_damage.get() or 0), int(inc_casualties.get() or 0), inc_notes.get(), dup.id), ref=dup.id)
+    return True
 
 def inc_update():
     sel = inc_tree.focus()
     if not sel: messagebox.showwarning("Select", "Pick an incident"); return
     iid = inc_tree.item(sel)["values"][0]
     aid = int(inc_area.get().split("ID:")[-1].replace(")",""))
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE incidents SET area_id=%s, date=%s, flood_level=%s, damage_estimate=%s, casualties=%s, notes=%s WHERE id=%s",
-                (aid, inc_date.get(), float(inc_level.get() or 0), float(inc_damage.get() or 0), int(inc_casualties.get() or 0), inc_notes.get(), iid))
-    conn.commit(); cur.close(); conn.close()
-    refresh_inc_table()
+    queue_write("incidents", "update", "UPDATE incidents SET area_id=%s, date=%s, flood_level=%s, damage_estimate=%s, casualties=%s, notes=%s WHERE id=%s",
+                (aid, inc_date.get(), float(inc_level.get() or 0), float(inc_damage.get() or 0), int(inc_casualties.get() or 0), inc_notes.get(), iid), ref=iid)
 
 def inc_delete():
     sel = inc_tree.focus()
     if not sel: return
     iid = inc_tree.item(sel)["values"][0]
     if not messagebox.askyesno("Confirm", f"Delete incident {iid}?"): return
-    conn = get_connection(); cur = conn.cursor(); cur.execute("DELETE FROM incidents WHERE id=%s", (iid,)); conn.commit(); cur.close(); conn.close()
-    refresh_inc_table()
+    queue_write("incidents", "delete", "DELETE FROM incidents WHERE id=%s", (iid,), ref=iid)
 
 def inc_on_select(event):
     sel = inc_tree.focus()
@@ -658,31 +1792,37 @@ rp_frame = ctk.CTkFrame(reports_tab)
 rp_frame.grid(row=0,column=0, sticky="ew", padx=8, pady=8)
 rp_frame.grid_columnconfigure((0,1,2,3,4), weight=1)
 
-report_select = ctk.CTkComboBox(rp_frame, values=["Top Damage Areas","Recent Incidents","Delayed Projects","Project Status Distribution"])
+report_select = ctk.CTkComboBox(rp_frame, values=["Top Damage Areas","Recent Incidents","Delayed Projects","Project Status Distribution","Possible Duplicates"])
 report_select.set("Top Damage Areas")
 report_select.grid(row=0,column=0, padx=8, pady=6, sticky="ew")
 
 def run_report():
+    pivot_state["active"] = False
     choice = report_select.get()
     if choice == "Top Damage Areas":
-        rows = fetch_rows("""SELECT a.name, SUM(i.damage_estimate) AS total_damage
-                             FROM areas a JOIN incidents i ON a.id=i.area_id
-                             GROUP BY a.id ORDER BY total_damage DESC LIMIT 10""")
-        show_report_table(rows, ("Area","Total Damage (PHP)"))
-        draw_bar_chart([r[0] for r in rows], [float(r[1]) for r in rows], "Top Damage by Area", ylabel="Damage (PHP)")
+        rows = incident_store.damage_by_area(limit=10)
+        show_report_table([(name, format_cents(cents)) for name, cents in rows], ("Area","Total Damage (PHP)"))
+        draw_bar_chart([r[0] for r in rows], [r[1] / 100 for r in rows], "Top Damage by Area", ylabel="Damage (PHP)")
     elif choice == "Recent Incidents":
-        rows = fetch_rows("""SELECT i.id, a.name, i.date, i.flood_level, i.damage_estimate FROM incidents i JOIN areas a ON i.area_id=a.id ORDER BY i.date DESC LIMIT 20""")
+        rows = [r.values()[:5] for r in incident_store.recent(limit=20)]
         show_report_table(rows, ("ID","Area","Date","Level(m)","Damage"))
         clear_chart()
     elif choice == "Delayed Projects":
-        rows = fetch_rows("""SELECT p.id, p.project_name, a.name, p.start_date, p.end_date, p.status FROM projects p JOIN areas a ON p.area_id=a.id WHERE p.status='Delayed' ORDER BY p.start_date""")
-        show_report_table(rows, ("ID","Project","Area","Start","End","Status"))
+        rows = fetch_report("Delayed Projects")
+        show_report_table(rows, REPORTS["Delayed Projects"]["headers"])
         clear_chart()
     elif choice == "Project Status Distribution":
-        rows = fetch_rows("""SELECT status, COUNT(*) FROM projects GROUP BY status""")
+        rows = fetch_report("Project Status Distribution")
         labels = [r[0] for r in rows]; sizes = [int(r[1]) for r in rows]
-        show_report_table(rows, ("Status","Count"))
+        show_report_table(rows, REPORTS["Project Status Distribution"]["headers"])
         draw_pie_chart(labels, sizes, "Projects by Status")
+    elif choice == "Possible Duplicates":
+        rows = []
+        for iid, dup_id, similarity in duplicate_index.duplicate_pairs():
+            a, b = incident_store.get(iid), incident_store.get(dup_id)
+            rows.append((iid, dup_id, a.area_name, a.date, b.date, f"{similarity:.0%}"))
+        show_report_table(rows, ("ID","Duplicate ID","Area","Date","Duplicate Date","Notes Similarity"))
+        clear_chart()
 
 ctk.CTkButton(rp_frame, text="Run Report", command=run_report).grid(row=0,column=1, padx=8, pady=6)
 ctk.CTkButton(rp_frame, text="Export shown table to CSV", command=lambda: export_tree_to_csv(report_tree, "report_export.csv")).grid(row=0,column=2, padx=8, pady=6)
@@ -752,22 +1892,169 @@ def draw_pie_chart(labels, sizes, title):
     chart_canvas_widget.draw()
     chart_canvas_widget.get_tk_widget().pack(fill="both", expand=True)
 
+# ----- Pivot / drill-down over the in-memory cube (no DB round trip per click) -----
+PIVOT_DIMENSIONS = {"Province": "province", "Area": "area", "Year": "year", "Month": "month",
+                    "Risk Level": "risk_level", "Project Status": "project_status"}
+PIVOT_MEASURES = {"Total Damage": 2, "Incidents": 1, "Casualties": 3, "Avg Level": 4}  # index in a group_by row
+DRILL_PATH = ["province", "area", "year", "month"]
+pivot_state = {"active": False, "dim": "province", "filters": {}, "rows": []}
+
+def pivot_label(dim):
+    return next(label for label, d in PIVOT_DIMENSIONS.items() if d == dim)
+
+def run_pivot():
+    label = pivot_dim_select.get()
+    dim = PIVOT_DIMENSIONS.get(label, "province")
+    rows = incident_cube.group_by([dim], pivot_state["filters"])
+    if dim == "area":  # grouped by area id; list them by name
+        rows.sort(key=lambda r: str(incident_cube.label(dim, r[0])))
+    pivot_state.update(active=True, dim=dim, rows=rows)
+    names = [incident_cube.label(dim, r[0]) for r in rows]
+    show_report_table([(name, r[1], f"{r[2]:,.2f}", r[3], f"{r[4]:.2f}") for name, r in zip(names, rows)],
+                      (label, "Incidents", "Total Damage (PHP)", "Casualties", "Avg Level(m)"))
+    measure = pivot_measure_select.get()
+    col = PIVOT_MEASURES.get(measure, 2)
+    draw_bar_chart([str(name) for name in names], [r[col] for r in rows], f"{measure} by {label}", ylabel=measure)
+    filters = pivot_state["filters"]
+    pivot_path_label.configure(text=" > ".join(f"{pivot_label(d)}: {incident_cube.label(d, v)}" for d, v in filters.items())
+                               or "All incidents")
+
+def pivot_drill_down(event):
+    if not pivot_state["active"]: return
+    sel = report_tree.focus()
+    if not sel: return
+    pivot_state["filters"][pivot_state["dim"]] = pivot_state["rows"][report_tree.index(sel)][0]
+    next_dim = next((d for d in DRILL_PATH if d not in pivot_state["filters"]), None)
+    if next_dim: pivot_dim_select.set(pivot_label(next_dim))
+    run_pivot()
+
+def pivot_reset():
+    pivot_state["filters"].clear()
+    pivot_dim_select.set("Province")
+    run_pivot()
+
+pivot_dim_select = ctk.CTkComboBox(rp_frame, values=list(PIVOT_DIMENSIONS))
+pivot_dim_select.set("Province")
+pivot_dim_select.grid(row=1,column=0, padx=8, pady=6, sticky="ew")
+pivot_measure_select = ctk.CTkComboBox(rp_frame, values=list(PIVOT_MEASURES))
+pivot_measure_select.set("Total Damage")
+pivot_measure_select.grid(row=1,column=1, padx=8, pady=6, sticky="ew")
+ctk.CTkButton(rp_frame, text="Run Pivot", command=run_pivot).grid(row=1,column=2, padx=8, pady=6)
+ctk.CTkButton(rp_frame, text="Reset Drill-down", command=pivot_reset).grid(row=1,column=3, padx=8, pady=6)
+pivot_path_label = ctk.CTkLabel(rp_frame, text="All incidents", text_color="gray")
+pivot_path_label.grid(row=1,column=4, padx=8, pady=6, sticky="w")
+
+report_tree.bind("<Double-1>", pivot_drill_down)
+
 # -----------------------
 # Utility: refresh area choices for combos
 # -----------------------
 def refresh_area_comboboxes():
-    rows = fetch_rows("SELECT id,name FROM areas ORDER BY id ASC")
+    rows = fetch_rows("SELECT id,name FROM areas ORDER BY id ASC", cache_key="area_choices")
     choices = [f"{r[1]} (ID:{r[0]})" for r in rows]
     proj_area.configure(values=choices)
     inc_area.configure(values=choices)
 
+# -----------------------
+# Write queue: every Add/Update/Delete goes through the offline journal
+# -----------------------
+JOURNAL_POLL_MS = 300
+write_journal = WriteJournal(JOURNAL_PATH)
+write_journal.online = SCHEMA_READY
+tables_to_refresh = set()
+was_online = [write_journal.online]
+
+def queue_write(table, op, sql, params, ref=None, error_hint=None):
+    entry = {"table": table, "op": op, "sql": sql, "params": list(params), "ref": ref, "error_hint": error_hint}
+    index_pending_incident(dict(entry, key=write_journal.submit(entry)))
+    update_queued_writes_label()
+
+def index_pending_incident(entry):
+    """Let the duplicate check see an incident insert that is still waiting in the journal."""
+    if entry["table"] != "incidents" or entry["op"] != "insert": return
+    aid, day_text, notes = entry["params"][0], entry["params"][1], entry["params"][5]
+    try:
+        day = (datetime.strptime(str(day_text), "%Y-%m-%d").date() - EPOCH).days
+    except ValueError:
+        return
+    duplicate_index.add_pending(entry["key"], aid, day, notes)
+
+def update_queued_writes_label():
+    text = f"Queued writes: {write_journal.queued()}"
+    if not write_journal.online: text += " (offline)"
+    elif write_journal.error: text += " (retrying, click for details)"
+    healthy = write_journal.online and not write_journal.error
+    queued_writes_label.configure(text=text, text_color="gray" if healthy else "#e74c3c")
+
+def discard_stuck_write():
+    entry = write_journal.stuck
+    if entry is None or not write_journal.error: return
+    if messagebox.askyesno("Queued write keeps failing",
+                           f"{entry['table']} {entry['op']} with {entry['params']}\n\n{write_journal.error}\n\n"
+                           "Discard this write so the ones queued after it can be saved?"):
+        write_journal.discard(entry["key"])
+
+def apply_write_in_memory(entry, lastrowid):
+    """Bring the shared incident store, then the cube and duplicate index built on it, up to date with one write."""
+    table, op, ref = entry["table"], entry["op"], entry["ref"]
+    if table == "incidents":
+        if op == "insert" and lastrowid is None:  # replayed after a crash, id unknown
+            incident_store.load(); incident_cube.load(); duplicate_index.build()
+            return
+        iid = lastrowid if op == "insert" else ref
+        incident_store.refresh_incident(iid); incident_cube.refresh_incident(iid); duplicate_index.refresh_incident(iid)
+    elif table == "areas" and op == "update":
+        incident_store.refresh_areas(ref); incident_cube.refresh_areas(ref)
+    elif table == "projects":
+        # an area's project status may have changed
+        incident_store.refresh_areas(); incident_cube.refresh_areas()
+
+def poll_write_journal():
+    """Pick up replayed writes on the Tk thread and refresh whatever they touched."""
+    try:
+        while True:
+            entry, lastrowid, error = write_journal.applied.get_nowait()
+            duplicate_index.remove_pending(entry["key"])
+            if error == JOURNAL_DISCARDED:
+                continue
+            if error:
+                messagebox.showerror("Write rejected", entry["error_hint"] or f"{entry['table']} {entry['op']} failed: {error}")
+                continue
+            tables_to_refresh.add(entry["table"])
+            try:
+                apply_write_in_memory(entry, lastrowid)
+            except mysql.connector.Error:
+                tables_to_refresh.add("memory")  # link dropped mid-refresh; reload on a later poll
+    except queue.Empty:
+        pass
+    if write_journal.online and not was_online[0]:
+        # link is back: replace the last-known (cached) data with the live tables
+        tables_to_refresh.update(("memory", "areas", "projects", "incidents"))
+    was_online[0] = write_journal.online
+    try:
+        if "memory" in tables_to_refresh:
+            incident_store.load(); incident_cube.load(); duplicate_index.build()
+        if "areas" in tables_to_refresh: refresh_area_table()
+        if tables_to_refresh & {"areas", "projects"}: refresh_proj_table()
+        if tables_to_refresh & {"areas", "incidents"}: refresh_inc_table()
+        tables_to_refresh.clear()
+    except mysql.connector.Error:
+        pass
+    update_queued_writes_label()
+    app.after(JOURNAL_POLL_MS, poll_write_journal)
+
 # -----------------------
 # Initial refresh functions
 # -----------------------
 def refresh_all():
-    refresh_area_table(); refresh_proj_table(); refresh_inc_table()
+    for refresh in (refresh_area_table, refresh_proj_table, refresh_inc_table):
+        run_offline_tolerant(refresh)
 
 refresh_all()
+for entry in list(write_journal.pending):  # left over from a previous session
+    index_pending_incident(entry)
+write_journal.start()  # also replays anything left over from a previous session
+poll_write_journal()
 
 # -----------------------
 # wire up helper functions used earlier that were defined below